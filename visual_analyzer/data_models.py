@@ -1,3 +1,6 @@
+import hashlib
+import json
+
 KNOWLEDGE_BASE = {
     "Rash / Inflammation": {
         "description": "A red, irritated area of the skin that may be itchy, painful, or swollen. Common causes include allergies, dermatitis, or mild heat burns.",
@@ -138,3 +141,22 @@ KNOWLEDGE_BASE = {
         ]
     }
 }
+
+# Stable short IDs for compact responses; clients resolve them via /knowledge-base
+LABEL_IDS = {
+    "Rash / Inflammation": "rash",
+    "Minor Injury / Scrape": "scrape",
+    "Cut / Wound": "cut",
+    "Bruise / Contusion": "bruise",
+    "Burn": "burn",
+    "Insect Bite": "bite",
+    "Other anomalies": "other"
+}
+
+# Compact responses send severity as an index into this list
+SEVERITY_LEVELS = ["Mild", "Moderate", "Severe"]
+
+# Content hash of the knowledge base; changes whenever any entry is edited
+KB_VERSION = hashlib.sha256(
+    json.dumps([KNOWLEDGE_BASE, LABEL_IDS, SEVERITY_LEVELS], sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
@@ -2,9 +2,12 @@ import cv2
 import numpy as np
 import json
 import os
-from data_models import KNOWLEDGE_BASE
+from data_models import KNOWLEDGE_BASE, LABEL_IDS, SEVERITY_LEVELS
 
 class VisualDiagnosisEngine:
+    # Smallest contour area each mask can turn into a detection
+    MIN_AREA = {"red": 1200, "light_red": 800, "bruise": 1500, "cuts": 400}
+
     def __init__(self):
         pass
 
@@ -16,25 +19,31 @@ class VisualDiagnosisEngine:
         # 1. Resize for consistent analysis
         img = cv2.resize(img, (800, 800))
         
+        return img, self.enhance(img)
+
+    def enhance(self, img):
+        return self.equalize(self.denoise(img))
+
+    def denoise(self, img):
         # 2. Denoise using Bilateral Filter (preserves edges)
-        denoised = cv2.bilateralFilter(img, 9, 75, 75)
-        
+        return cv2.bilateralFilter(img, 9, 75, 75)
+
+    def equalize(self, denoised):
         # 3. Enhance Contrast using CLAHE
         lab = cv2.cvtColor(denoised, cv2.COLOR_BGR2LAB)
         l, a, b = cv2.split(lab)
         clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
         cl = clahe.apply(l)
         limg = cv2.merge((cl, a, b))
-        enhanced = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
-        
-        return img, enhanced
+        return cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
 
     def detect_anomalies(self, original, enhanced):
+        return self.find_regions(self.build_masks(enhanced))
+
+    def build_masks(self, enhanced):
         hsv = cv2.cvtColor(enhanced, cv2.COLOR_BGR2HSV)
         gray = cv2.cvtColor(enhanced, cv2.COLOR_BGR2GRAY)
         
-        results = []
-        
         # --- RASH / BURN / REDNESS ---
         lower_red1, upper_red1 = np.array([0, 100, 100]), np.array([10, 255, 255])
         lower_red2, upper_red2 = np.array([160, 100, 100]), np.array([179, 255, 255])
@@ -51,12 +60,33 @@ class VisualDiagnosisEngine:
         edges = cv2.Canny(gray, 40, 120)
         dilated = cv2.dilate(edges, np.ones((5,5), np.uint8), iterations=1)
 
+        return {"hsv": hsv, "red": red_mask, "bruise": bruise_mask, "light_red": light_red_mask, "cuts": dilated}
+
+    def find_regions(self, masks, window=None, existing=None):
+        """
+        Runs contour analysis over the masks from build_masks().
+        `window` (x0, y0, x1, y1) restricts the search to a sub-rectangle; bboxes are
+        still reported in full-frame coordinates. `existing` red/light-red detections
+        outside the window take part in the light-redness overlap check, as the
+        detections found earlier in a full pass would.
+        """
+        hsv = masks["hsv"]
+        x0, y0, x1, y1 = window if window else (0, 0, hsv.shape[1], hsv.shape[0])
+        red_mask = masks["red"][y0:y1, x0:x1]
+        bruise_mask = masks["bruise"][y0:y1, x0:x1]
+        light_red_mask = masks["light_red"][y0:y1, x0:x1]
+        dilated = masks["cuts"][y0:y1, x0:x1]
+
+        results = []
+        others = list(existing or [])
+
         # REDNESS Analysis - distinguish between burns and minor injuries
         contours, _ = cv2.findContours(red_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         for cnt in contours:
             area = cv2.contourArea(cnt)
-            if area > 1200:
+            if area > self.MIN_AREA["red"]:
                 x, y, w, h = cv2.boundingRect(cnt)
+                x, y = x + x0, y + y0
                 
                 # Calculate intensity to distinguish burns from minor injuries
                 roi = hsv[y:y+h, x:x+w]
@@ -72,31 +102,33 @@ class VisualDiagnosisEngine:
                 else:
                     label = "Minor Injury / Scrape"
                     
-                results.append({"label": label, "area": int(area), "bbox": [int(x), int(y), int(w), int(h)]})
+                results.append({"label": label, "area": int(area), "bbox": [int(x), int(y), int(w), int(h)], "mask": "red"})
 
         # LIGHT REDNESS (Minor injuries) - for areas not caught above
         light_contours, _ = cv2.findContours(light_red_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         for cnt in light_contours:
             area = cv2.contourArea(cnt)
-            if 800 < area < 15000:  # Smaller areas that are lightly red
+            if self.MIN_AREA["light_red"] < area < 15000:  # Smaller areas that are lightly red
                 x, y, w, h = cv2.boundingRect(cnt)
+                x, y = x + x0, y + y0
                 # Check if this area doesn't overlap with existing detections
                 is_new = True
-                for existing in results:
+                for existing in results + others:
                     ex, ey, ew, eh = existing['bbox']
                     if abs(x - ex) < 50 and abs(y - ey) < 50:
                         is_new = False
                         break
                 if is_new:
-                    results.append({"label": "Minor Injury / Scrape", "area": int(area), "bbox": [int(x), int(y), int(w), int(h)]})
+                    results.append({"label": "Minor Injury / Scrape", "area": int(area), "bbox": [int(x), int(y), int(w), int(h)], "mask": "light_red"})
 
         # BRUISE Analysis
         contours, _ = cv2.findContours(bruise_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         for cnt in contours:
             area = cv2.contourArea(cnt)
-            if area > 1500:
+            if area > self.MIN_AREA["bruise"]:
                 x, y, w, h = cv2.boundingRect(cnt)
-                results.append({"label": "Bruise / Contusion", "area": int(area), "bbox": [int(x), int(y), int(w), int(h)]})
+                x, y = x + x0, y + y0
+                results.append({"label": "Bruise / Contusion", "area": int(area), "bbox": [int(x), int(y), int(w), int(h)], "mask": "bruise"})
 
         # CUTS Analysis
         contours, _ = cv2.findContours(dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -105,34 +137,81 @@ class VisualDiagnosisEngine:
             rect = cv2.minAreaRect(cnt)
             _, (cw, ch), _ = rect
             aspect_ratio = max(cw, ch) / (min(cw, ch) + 1e-5)
-            if area > 400 and aspect_ratio > 3.5:
+            if area > self.MIN_AREA["cuts"] and aspect_ratio > 3.5:
                 x, y, w, h = cv2.boundingRect(cnt)
-                results.append({"label": "Cut / Wound", "area": int(area), "bbox": [int(x), int(y), int(w), int(h)]})
+                x, y = x + x0, y + y0
+                results.append({"label": "Cut / Wound", "area": int(area), "bbox": [int(x), int(y), int(w), int(h)], "mask": "cuts"})
 
         return results
 
-    def analyze(self, image_path: str):
+    def grade(self, anomalies):
+        """Severity and confidence for detections sorted largest-first."""
+        primary = anomalies[0]
+        severity = "Mild"
+        if primary['area'] > 12000 or len(anomalies) > 3: severity = "Moderate"
+        if primary['area'] > 40000: severity = "Severe"
+        confidence = min(0.65 + (len(anomalies) * 0.05), 0.95)
+        return severity, confidence
+
+    def describe_region(self, masks, bbox):
+        """
+        Compact colour descriptor for a detected region: a 16-bin hue histogram
+        plus mean saturation and value, all scaled to 0-255 (18 bytes).
+        """
+        x, y, w, h = bbox
+        roi = masks["hsv"][y:y+h, x:x+w]
+        hist = cv2.calcHist([roi], [0], None, [16], [0, 180]).flatten()
+        hist = hist / (hist.max() + 1e-5) * 255
+        return [int(v) for v in hist] + [int(np.mean(roi[:,:,1])), int(np.mean(roi[:,:,2]))]
+
+    def compact_result(self, anomalies):
+        """
+        Minimal result for constrained links: label IDs from LABEL_IDS, severity as
+        an index into SEVERITY_LEVELS and [x, y, w, h] boxes in whole percent of the
+        frame. The knowledge-base version travels in the /knowledge-base ETag.
+        """
+        other = LABEL_IDS["Other anomalies"]
+        if not anomalies:
+            return {"id": other, "conf": 0.35, "sev": 0, "ids": [], "boxes": []}
+
+        severity, confidence = self.grade(anomalies)
+        return {
+            "id": LABEL_IDS.get(anomalies[0]['label'], other),
+            "conf": round(confidence, 2),
+            "sev": SEVERITY_LEVELS.index(severity),
+            "ids": sorted({LABEL_IDS.get(a['label'], other) for a in anomalies}),
+            "boxes": [[round(v/8) for v in a['bbox']] for a in anomalies[:4]]
+        }
+
+    def analyze(self, image_path: str, include_regions: bool = False, compact: bool = False):
+        """
+        With compact=True only label IDs, scores and annotations are returned;
+        the prose is served separately by /knowledge-base.
+        """
         try:
             original, enhanced = self.preprocess(image_path)
-            anomalies = self.detect_anomalies(original, enhanced)
-            
+            masks = self.build_masks(enhanced)
+            anomalies = self.find_regions(masks)
+            anomalies.sort(key=lambda x: x['area'], reverse=True)
+
+            if compact:
+                return self.compact_result(anomalies)
+
             if not anomalies:
+                kb_data = KNOWLEDGE_BASE["Other anomalies"]
                 return {
                     "label": "Other anomalies",
                     "confidence": 0.35, "severity": "Mild",
-                    "description": "Detected a minor skin variation. If you feel pain, consult a specialist.",
-                    "advice": ["Keep the area clean.", "Monitor for 24h."],
-                    "next_steps": ["Observe for any changes."], "annotations": []
+                    "description": kb_data["description"],
+                    "advice": kb_data["advice"],
+                    "next_steps": kb_data["next_steps"], "annotations": [],
+                    **({"regions": []} if include_regions else {})
                 }
-            
-            anomalies.sort(key=lambda x: x['area'], reverse=True)
+
             primary = anomalies[0]
             unique_labels = list(set([a['label'] for a in anomalies]))
             
-            severity = "Mild"
-            if primary['area'] > 12000 or len(anomalies) > 3: severity = "Moderate"
-            if primary['area'] > 40000: severity = "Severe"
-            confidence = min(0.65 + (len(anomalies) * 0.05), 0.95)
+            severity, confidence = self.grade(anomalies)
 
             # Heuristics for body parts (placeholder for real CV segmentation)
             body_part = "Detected Limb/Area" 
@@ -144,7 +223,7 @@ class VisualDiagnosisEngine:
                 "next_steps": ["Monitor for changes in size or color."]
             })
 
-            return {
+            result = {
                 "label": primary['label'],
                 "confidence": round(confidence, 2),
                 "severity": severity,
@@ -161,5 +240,14 @@ class VisualDiagnosisEngine:
                     "h": round(a['bbox'][3]/8, 1)
                 } for a in anomalies[:4]]
             }
+            if include_regions:
+                # Full-resolution regions for progress tracking (see tracking.py)
+                result["regions"] = [{
+                    "label": a['label'],
+                    "area": a['area'],
+                    "bbox": a['bbox'],
+                    "descriptor": self.describe_region(masks, a['bbox'])
+                } for a in anomalies]
+            return result
         except Exception as e:
             return {"error": str(e)}
@@ -0,0 +1,309 @@
+import sys
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+
+import cv2
+import httpx
+import numpy as np
+
+# Ensure local imports work
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def synthetic_images(count=8, seed=0):
+    """
+    JPEG uploads resembling real submissions: a skin-toned frame with a few
+    red, purple or linear marks so every detector branch gets exercised.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        img = np.full((720, 960, 3), (140, 170, 210), np.uint8)
+        img = cv2.add(img, rng.integers(0, 25, img.shape, dtype=np.uint8))
+        for _ in range(int(rng.integers(1, 5))):
+            center = (int(rng.integers(80, 880)), int(rng.integers(80, 640)))
+            axes = (int(rng.integers(20, 140)), int(rng.integers(20, 140)))
+            color = [(40, 40, 200), (140, 60, 90), (90, 110, 220)][int(rng.integers(0, 3))]
+            cv2.ellipse(img, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+        if rng.random() < 0.5:
+            p1 = (int(rng.integers(0, 960)), int(rng.integers(0, 720)))
+            p2 = (int(rng.integers(0, 960)), int(rng.integers(0, 720)))
+            cv2.line(img, p1, p2, (30, 30, 90), 3)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        images.append(buf.tobytes())
+    return images
+
+
+def synthetic_trace(rate, duration, images, compact=False, seed=0, poisson=True):
+    """Arrivals at `rate` req/s for `duration` seconds: Poisson, or evenly spaced."""
+    rng = random.Random(seed)
+    if not poisson:
+        return [{"offset": i / rate, "body": images[rng.randrange(len(images))], "compact": compact}
+                for i in range(int(rate * duration))]
+    trace, t = [], 0.0
+    while True:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            return trace
+        trace.append({"offset": t, "body": images[rng.randrange(len(images))], "compact": compact})
+
+
+def load_trace(path, speed=1.0):
+    """
+    Recorded trace: JSON lines of {"offset": seconds, "file": image path, "compact": bool}.
+    Relative image paths resolve against the trace file. `speed` > 1 replays faster.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    cache, trace = {}, []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            image = os.path.join(base, entry["file"])
+            if image not in cache:
+                with open(image, "rb") as img:
+                    cache[image] = img.read()
+            trace.append({"offset": float(entry["offset"]) / speed, "body": cache[image],
+                          "compact": bool(entry.get("compact", False))})
+    trace.sort(key=lambda e: e["offset"])
+    return trace
+
+
+def read_rss(pid):
+    """Resident set size in bytes of `pid` plus all of its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class LocalServer:
+    """Runs server.py under uvicorn in a subprocess for the duration of a test."""
+
+    def __init__(self, workers=1, port=8765):
+        self.workers = workers
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=HERE
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.url}/health", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError("uvicorn did not become healthy within 60s")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def replay(client, trace, concurrency, server_pid, timeout):
+    """
+    Open-loop replay: each request is released at its trace offset regardless of
+    how earlier ones are doing. Latency is measured from the scheduled time, so
+    queueing behind the concurrency limit counts against the server.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+    peak_rss = read_rss(server_pid)
+    start = time.perf_counter()
+
+    async def fire(entry):
+        delay = entry["offset"] - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        scheduled = start + entry["offset"]
+        async with semaphore:
+            try:
+                response = await client.post(
+                    "/analyze", params={"compact": "true"} if entry["compact"] else None,
+                    files={"file": ("upload.jpg", entry["body"], "image/jpeg")}, timeout=timeout
+                )
+                # The engine reports failures as a 200 with an "error" key
+                if response.status_code >= 400 or b'"error"' in response.content:
+                    errors.append(response.status_code)
+                else:
+                    latencies.append(time.perf_counter() - scheduled)
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            await asyncio.sleep(0.5)
+            peak_rss = max(peak_rss, read_rss(server_pid))
+
+    sampler = asyncio.create_task(sample_rss())
+    try:
+        await asyncio.gather(*(fire(entry) for entry in trace))
+    finally:
+        sampler.cancel()
+    elapsed = time.perf_counter() - start
+    peak_rss = max(peak_rss, read_rss(server_pid))
+
+    latencies.sort()
+    total = len(latencies) + len(errors)
+    return {
+        "requests": total,
+        "offered_rate": round(len(trace) / trace[-1]["offset"], 2) if trace and trace[-1]["offset"] else None,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50": _ms(percentile(latencies, 50)),
+        "latency_p95": _ms(percentile(latencies, 95)),
+        "latency_p99": _ms(percentile(latencies, 99)),
+        "error_rate": round(len(errors) / total, 4) if total else 0.0,
+        "errors": sorted({str(e) for e in errors}),
+        "server_rss_mb": round(peak_rss / 2**20, 1) if server_pid else None,
+        "elapsed_s": round(elapsed, 2)
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def make_client(args, server):
+    if server is not None:
+        return httpx.AsyncClient(base_url=server.url), server.process.pid
+    if args.url:
+        return httpx.AsyncClient(base_url=args.url), args.server_pid
+    # In-process: the app shares this event loop, so /analyze blocks the generator
+    # while it runs. Good for profiling the handler, not for sizing hardware.
+    from server import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest"), os.getpid()
+
+
+async def run_once(args, trace, server):
+    client, pid = make_client(args, server)
+    async with client:
+        return await replay(client, trace, args.concurrency, pid, args.timeout)
+
+
+async def saturate(args, images, server):
+    """
+    Steps the target rate up geometrically until the run stops being sustainable
+    (throughput below 90% of offered, p99 above the SLO, or too many errors).
+    Steps use evenly spaced arrivals so the offered rate is the target rate; the
+    reported maximum is still the rate the last sustainable step really offered.
+    """
+    curve, best, rate = [], None, args.rate
+    while rate <= args.max_rate:
+        trace = synthetic_trace(rate, args.duration, images, args.compact, poisson=False)
+        offered = len(trace) / args.duration
+        stats = await run_once(args, trace, server)
+        stats["target_rate"] = round(rate, 2)
+        stats["offered_rate"] = round(offered, 2)
+        stats["sustainable"] = (
+            stats["error_rate"] <= args.max_error_rate
+            and stats["latency_p99"] is not None and stats["latency_p99"] <= args.p99_slo_ms
+            and stats["throughput"] >= 0.9 * offered
+        )
+        curve.append(stats)
+        if not stats["sustainable"]:
+            break
+        best = offered
+        rate *= args.step
+    return {"max_sustainable_rate": round(best, 2) if best else None, "curve": curve}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the Visual Diagnosis Bridge")
+    parser.add_argument("mode", choices=["run", "saturate"], help="Single run or saturation-curve search")
+    parser.add_argument("--trace", help="Recorded JSONL trace to replay (run mode; default: synthetic)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier for --trace")
+    parser.add_argument("--rate", type=float, default=2.0, help="Requests/s (saturate: starting rate)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per run or saturation step")
+    parser.add_argument("--concurrency", type=int, default=16, help="Max in-flight requests")
+    parser.add_argument("--compact", action="store_true", help="Request compact responses")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--workers", type=int, help="Spawn a local uvicorn with this many workers")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the spawned uvicorn")
+    parser.add_argument("--url", help="Target an already running server instead")
+    parser.add_argument("--server-pid", type=int, help="PID of the --url server, for RSS reporting")
+    parser.add_argument("--step", type=float, default=1.5, help="Rate multiplier between saturation steps")
+    parser.add_argument("--max-rate", type=float, default=500.0, help="Upper bound for the saturation search")
+    parser.add_argument("--p99-slo-ms", type=float, default=2000.0, help="p99 latency limit for a sustainable rate")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error-rate limit for a sustainable rate")
+
+    args = parser.parse_args()
+    if args.mode == "saturate" and not (args.workers or args.url):
+        # In-process the app shares the generator's event loop, so the curve would
+        # measure the load generator stalling rather than the server saturating.
+        parser.error("saturate needs a real server: pass --workers N or --url")
+    images = synthetic_images()
+
+    async def go(server):
+        if args.mode == "saturate":
+            return await saturate(args, images, server)
+        trace = load_trace(args.trace, args.speed) if args.trace else \
+            synthetic_trace(args.rate, args.duration, images, args.compact)
+        if not trace:
+            return {"error": "Trace is empty"}
+        return await run_once(args, trace, server)
+
+    if args.workers:
+        with LocalServer(args.workers, args.port) as server:
+            report = asyncio.run(go(server))
+    else:
+        report = asyncio.run(go(None))
+
+    report["config"] = {"mode": args.mode, "concurrency": args.concurrency, "workers": args.workers,
+                        "target": args.url or ("uvicorn" if args.workers else "in-process")}
+    if report["config"]["target"] == "in-process":
+        report["config"]["warning"] = ("in-process target blocks the load generator's event loop during "
+                                       "analysis; latencies are not open-loop. Use --workers or --url for sizing.")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,15 @@ import sys
 import os
 import json
 import argparse
+from datetime import datetime
 
 # Ensure local imports work
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from engine import VisualDiagnosisEngine
-from data_models import KNOWLEDGE_BASE
+from tracking import ProgressStore, diff_snapshots
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "progress.db")
 
 def main():
     parser = argparse.ArgumentParser(description="Offline Visual Diagnosis Engine")
@@ -15,6 +18,10 @@ def main():
     parser.add_argument("--track", action="store_true", help="Enable progress tracking comparison")
     parser.add_argument("--severity", action="store_true", help="Predict severity level")
     parser.add_argument("--annotate", action="store_true", help="Generate coordinate annotations")
+    parser.add_argument("--patient", default="default", help="Patient ID used by --track")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Progress history database used by --track")
+    parser.add_argument("--taken-at", help="ISO timestamp of the photo for --track (default: now)")
+    parser.add_argument("--compact", action="store_true", help="Emit label IDs, scores and annotations only")
     
     args = parser.parse_args()
 
@@ -22,17 +29,46 @@ def main():
         print(json.dumps({"error": f"Path not found: {args.image_path}"}))
         return
 
+    captured_at = None
+    if args.taken_at:
+        try:
+            captured_at = datetime.fromisoformat(args.taken_at).timestamp()
+        except ValueError:
+            print(json.dumps({"error": f"Invalid --taken-at timestamp: {args.taken_at}"}))
+            return
+
     engine = VisualDiagnosisEngine()
-    result = engine.analyze(args.image_path)
-    
-    # Enrich with more detailed knowledge base info if needed
-    if "label" in result and result["label"] in KNOWLEDGE_BASE:
-        kb_info = KNOWLEDGE_BASE[result["label"]]
-        result["description"] = kb_info["description"]
-        result["advice"] = kb_info["advice"]
-        result["next_steps"] = kb_info["next_steps"]
+    if not args.track:
+        result = engine.analyze(args.image_path, compact=args.compact)
+        print(json.dumps(result, indent=2))
+        return
+
+    # Tracking needs the full-resolution regions; compact output is derived from them
+    result = engine.analyze(args.image_path, include_regions=True)
+    if "error" not in result:
+        progress = track_progress(args, result, captured_at)
+        if args.compact:
+            result = engine.compact_result(result["regions"])
+        result["progress"] = progress
+    result.pop("regions", None)
 
     print(json.dumps(result, indent=2))
 
+def track_progress(args, result, captured_at):
+    store = ProgressStore(args.db)
+    try:
+        previous = store.latest(args.patient, before=captured_at)
+        snapshot_id = store.record(args.patient, result, os.path.abspath(args.image_path), captured_at)
+        current = {"id": snapshot_id, "label": result["label"], "severity": result.get("severity"),
+                   "total_area": sum(r["area"] for r in result["regions"]), "regions": result["regions"]}
+        progress = {"patient_id": args.patient, "snapshot_id": snapshot_id, "history_size": store.count(args.patient)}
+        if previous is None:
+            progress["baseline"] = True
+        else:
+            progress.update(diff_snapshots(previous, current))
+        return progress
+    finally:
+        store.close()
+
 if __name__ == "__main__":
     main()
@@ -1,10 +1,14 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Request, Response
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
 import shutil
 import tempfile
 from engine import VisualDiagnosisEngine
+from stream import FrameStreamSession
+from data_models import KNOWLEDGE_BASE, LABEL_IDS, SEVERITY_LEVELS, KB_VERSION
+from encoding import dumps
 
 app = FastAPI(title="Sanjeevani Visual Diagnosis Bridge")
 
@@ -19,8 +23,30 @@ app.add_middleware(
 
 engine = VisualDiagnosisEngine()
 
+# The knowledge base is static for the life of the process: serialize it once
+KB_ETAG = f'"{KB_VERSION}"'
+KB_BODY = dumps({
+    "version": KB_VERSION,
+    "severities": SEVERITY_LEVELS,
+    "labels": {LABEL_IDS[name]: {"name": name, **entry} for name, entry in KNOWLEDGE_BASE.items()}
+})
+KB_HEADERS = {"ETag": KB_ETAG, "Cache-Control": "public, max-age=86400"}
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match check per RFC 9110: weak comparison, "*" matches any tag."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+def json_response(content) -> Response:
+    return Response(content=dumps(content), media_type="application/json")
+
 @app.post("/analyze")
-async def analyze_image(file: UploadFile = File(...)):
+async def analyze_image(file: UploadFile = File(...), compact: bool = False):
     try:
         # Create a temporary file to store the uploaded image
         with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp:
@@ -28,15 +54,46 @@ async def analyze_image(file: UploadFile = File(...)):
             temp_path = temp.name
 
         # Run analysis using the engine
-        result = engine.analyze(temp_path)
+        result = engine.analyze(temp_path, compact=compact)
 
         # Clean up the temporary file
         os.unlink(temp_path)
 
-        return result
+        return json_response(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/knowledge-base")
+def knowledge_base(request: Request):
+    """Versioned label texts for compact /analyze responses; clients cache by ETag."""
+    if etag_matches(request.headers.get("if-none-match", ""), KB_ETAG):
+        return Response(status_code=304, headers=KB_HEADERS)
+    return Response(content=KB_BODY, media_type="application/json", headers=KB_HEADERS)
+
+@app.websocket("/stream")
+async def stream_frames(websocket: WebSocket):
+    """
+    Live camera analysis: the client sends encoded frames (JPEG/PNG bytes) and
+    receives one JSON annotation message per frame. State lives for the
+    lifetime of the connection.
+    """
+    await websocket.accept()
+    session = FrameStreamSession(engine)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            frame = message.get("bytes")
+            if frame is None:
+                await websocket.send_json({"frame": session.frame_index, "error": "Expected a binary image frame"})
+                continue
+            # OpenCV work runs off the event loop so other sessions keep flowing
+            result = await run_in_threadpool(session.process_frame, frame)
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        pass
+
 @app.get("/health")
 def health_check():
     return {"status": "online", "engine": "VisualDiagnosisEngine v1.0"}
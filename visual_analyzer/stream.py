@@ -0,0 +1,226 @@
+import cv2
+import numpy as np
+
+# Frames are analysed at the same 800x800 resolution as VisualDiagnosisEngine.preprocess,
+# so every area threshold in the engine keeps its meaning.
+FRAME_SIZE = 800
+# Change-detection tile size. CLAHE always runs over the whole frame; matching its
+# 8x8 grid (100px at 800px) means a changed tile only moves the equalised pixels
+# of its one-tile neighbourhood, which is what gets re-masked.
+TILE_SIZE = 100
+# Context pixels around a dirty tile so bilateral/Canny/dilate see real neighbours.
+TILE_HALO = 16
+# Masks whose earlier detections take part in the light-redness overlap check.
+RED_FAMILY = ("red", "light_red")
+# Grey-level change (0-255) at which a single pixel counts as changed; above
+# camera noise, below the contrast of a lesion edge.
+PIXEL_CHANGE_THRESHOLD = 20
+# Share of changed pixels that marks a tile as dirty. A tile mean would dilute the
+# thin strip swept by a slowly moving edge until it never triggers.
+CHANGED_FRACTION = 0.005
+# Above this share of dirty tiles a full re-analysis is cheaper than patching.
+FULL_REFRESH_RATIO = 0.5
+# Forced full re-analysis so patched tiles can never drift from a clean pass.
+KEYFRAME_INTERVAL = 120
+
+
+class FrameStreamSession:
+    """
+    Per-connection state for live camera analysis.
+
+    Each frame is compared tile by tile against the last analysed frame. Only the
+    tiles that changed are re-denoised; contrast equalisation runs on the whole
+    frame as in a keyframe, and masks are rebuilt for the changed tiles plus the
+    ring around them that CLAHE interpolation reaches. Contour analysis is re-run
+    only inside the window covering those tiles; detections elsewhere are reused.
+    Detections are then smoothed over time so boxes do not flicker between frames.
+    """
+
+    def __init__(self, engine, smoothing=0.5, min_hits=2, max_misses=4):
+        self.engine = engine
+        self.smoothing = smoothing
+        self.min_hits = min_hits
+        self.max_misses = max_misses
+        self.frame_index = 0
+        self.grid = FRAME_SIZE // TILE_SIZE
+        self._reference = None   # grey frame each tile was last analysed from
+        self._denoised = None    # bilateral-filtered frame, patched tile by tile
+        self._masks = None       # full-frame masks, patched tile by tile
+        self._detections = []    # raw detections for the current masks
+        self._tracks = []        # temporally smoothed detections
+
+    def process_frame(self, data: bytes):
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return {"frame": self.frame_index, "error": "Could not decode frame"}
+        frame = cv2.resize(frame, (FRAME_SIZE, FRAME_SIZE))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        dirty = self._dirty_tiles(gray)
+        is_keyframe = (
+            self._masks is None
+            or self.frame_index % KEYFRAME_INTERVAL == 0
+            or len(dirty) > FULL_REFRESH_RATIO * self.grid * self.grid
+        )
+
+        if is_keyframe:
+            self._denoised = self.engine.denoise(frame)
+            self._masks = self.engine.build_masks(self.engine.equalize(self._denoised))
+            self._detections = self.engine.find_regions(self._masks)
+            self._reference = gray
+        elif dirty:
+            for tx, ty in dirty:
+                self._denoise_tile(frame, gray, tx, ty)
+            enhanced = self.engine.equalize(self._denoised)
+            remasked = set()
+            pending = set(self._with_neighbours(dirty))
+            # Every tile the contour window covers must carry masks from this frame,
+            # and refreshing them can reveal blobs that grow the window further.
+            while pending:
+                for tx, ty in pending:
+                    self._remask_tile(enhanced, tx, ty)
+                remasked |= pending
+                window = self._dirty_window(remasked)
+                pending = set(self._tiles_in(window)) - remasked
+            kept = [d for d in self._detections if not _overlaps(d['bbox'], window)]
+            found = self.engine.find_regions(
+                self._masks, window=window, existing=[d for d in kept if d['mask'] in RED_FAMILY]
+            )
+            self._detections = kept + found
+
+        self._update_tracks(self._detections)
+        result = self._summarize()
+        result["changed_tiles"] = self.grid * self.grid if is_keyframe else len(dirty)
+        self.frame_index += 1
+        return result
+
+    def _dirty_tiles(self, gray):
+        if self._reference is None:
+            return []
+        changed = (cv2.absdiff(gray, self._reference) > PIXEL_CHANGE_THRESHOLD).astype(np.float32)
+        # INTER_AREA down to the tile grid gives the changed-pixel share per tile.
+        per_tile = cv2.resize(changed, (self.grid, self.grid), interpolation=cv2.INTER_AREA)
+        ys, xs = np.nonzero(per_tile > CHANGED_FRACTION)
+        return list(zip(xs.tolist(), ys.tolist()))
+
+    def _tile_bounds(self, tx, ty):
+        x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+        x1, y1 = x0 + TILE_SIZE, y0 + TILE_SIZE
+        px0, py0 = max(x0 - TILE_HALO, 0), max(y0 - TILE_HALO, 0)
+        px1, py1 = min(x1 + TILE_HALO, FRAME_SIZE), min(y1 + TILE_HALO, FRAME_SIZE)
+        inner = (slice(y0 - py0, y1 - py0), slice(x0 - px0, x1 - px0))
+        return (x0, y0, x1, y1), (px0, py0, px1, py1), inner
+
+    def _denoise_tile(self, frame, gray, tx, ty):
+        (x0, y0, x1, y1), (px0, py0, px1, py1), inner = self._tile_bounds(tx, ty)
+        patch = self.engine.denoise(frame[py0:py1, px0:px1])
+        self._denoised[y0:y1, x0:x1] = patch[inner]
+        self._reference[y0:y1, x0:x1] = gray[y0:y1, x0:x1]
+
+    def _remask_tile(self, enhanced, tx, ty):
+        (x0, y0, x1, y1), (px0, py0, px1, py1), inner = self._tile_bounds(tx, ty)
+        patch_masks = self.engine.build_masks(enhanced[py0:py1, px0:px1])
+        for key, mask in patch_masks.items():
+            self._masks[key][y0:y1, x0:x1] = mask[inner]
+
+    def _with_neighbours(self, tiles):
+        # CLAHE blends each tile's mapping into its neighbours, so a change in one
+        # tile also shifts the equalised pixels in the ring around it.
+        grown = set()
+        for tx, ty in tiles:
+            for nx in range(max(tx - 1, 0), min(tx + 2, self.grid)):
+                for ny in range(max(ty - 1, 0), min(ty + 2, self.grid)):
+                    grown.add((nx, ny))
+        return sorted(grown)
+
+    def _tiles_in(self, window):
+        x0, y0, x1, y1 = window
+        return [(tx, ty)
+                for tx in range(x0 // TILE_SIZE, min(-(-x1 // TILE_SIZE), self.grid))
+                for ty in range(y0 // TILE_SIZE, min(-(-y1 // TILE_SIZE), self.grid))]
+
+    def _dirty_window(self, tiles):
+        xs = [tx for tx, _ in tiles]
+        ys = [ty for _, ty in tiles]
+        window = [min(xs) * TILE_SIZE, min(ys) * TILE_SIZE,
+                  (max(xs) + 1) * TILE_SIZE, (max(ys) + 1) * TILE_SIZE]
+
+        # Anything the window touches must lie fully inside it, otherwise it would
+        # be contoured truncated: previous detections, and mask blobs large enough
+        # to become a detection that now spill into unchanged tiles.
+        boxes = [d['bbox'] for d in self._detections]
+        for key, min_area in self.engine.MIN_AREA.items():
+            count, _, stats, _ = cv2.connectedComponentsWithStats(self._masks[key], connectivity=8)
+            boxes.extend(stats[i, :4].tolist() for i in range(1, count) if stats[i, 4] > min_area)
+
+        grown = True
+        while grown:
+            grown = False
+            for x, y, w, h in boxes:
+                if _overlaps((x, y, w, h), window) and not (
+                    window[0] <= x and window[1] <= y and x + w <= window[2] and y + h <= window[3]
+                ):
+                    window = [min(window[0], x), min(window[1], y),
+                              max(window[2], x + w), max(window[3], y + h)]
+                    grown = True
+        return tuple(window)
+
+    def _update_tracks(self, detections):
+        unmatched = list(detections)
+        for track in self._tracks:
+            best, best_iou = None, 0.3
+            for d in unmatched:
+                if d['label'] != track['label']:
+                    continue
+                iou = _iou(track['bbox'], d['bbox'])
+                if iou > best_iou:
+                    best, best_iou = d, iou
+            if best is None:
+                track['misses'] += 1
+                continue
+            unmatched.remove(best)
+            a = self.smoothing
+            track['bbox'] = [a * n + (1 - a) * o for n, o in zip(best['bbox'], track['bbox'])]
+            track['area'] = a * best['area'] + (1 - a) * track['area']
+            track['hits'] += 1
+            track['misses'] = 0
+
+        self._tracks = [t for t in self._tracks if t['misses'] <= self.max_misses]
+        for d in unmatched:
+            self._tracks.append({"label": d['label'], "area": float(d['area']),
+                                 "bbox": [float(v) for v in d['bbox']], "hits": 1, "misses": 0})
+
+    def _summarize(self):
+        visible = [t for t in self._tracks if t['hits'] >= self.min_hits]
+        visible.sort(key=lambda t: t['area'], reverse=True)
+        if not visible:
+            return {"frame": self.frame_index, "label": None, "annotations": []}
+
+        severity, confidence = self.engine.grade(visible)
+        scale = FRAME_SIZE / 100
+        return {
+            "frame": self.frame_index,
+            "label": visible[0]['label'],
+            "confidence": round(confidence, 2),
+            "severity": severity,
+            "annotations": [{
+                "label": t['label'],
+                "x": round(t['bbox'][0] / scale, 1),
+                "y": round(t['bbox'][1] / scale, 1),
+                "w": round(t['bbox'][2] / scale, 1),
+                "h": round(t['bbox'][3] / scale, 1)
+            } for t in visible[:4]]
+        }
+
+
+def _overlaps(bbox, window):
+    x, y, w, h = bbox
+    return x < window[2] and window[0] < x + w and y < window[3] and window[1] < y + h
+
+
+def _iou(a, b):
+    ix = max(0.0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
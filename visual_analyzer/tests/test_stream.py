@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import VisualDiagnosisEngine
+from stream import FrameStreamSession, FRAME_SIZE
+
+
+def _moving_lesion_frames(count=60, step=8, radius=60):
+    rng = np.random.default_rng(0)
+    background = np.full((FRAME_SIZE, FRAME_SIZE, 3), (140, 170, 210), np.uint8)
+    background = cv2.add(background, rng.integers(0, 12, background.shape, dtype=np.uint8))
+    for i in range(count):
+        frame = background.copy()
+        cv2.circle(frame, (100 + i * step, 400), radius, (40, 40, 200), -1)
+        ok, buf = cv2.imencode(".png", frame)
+        yield frame, buf.tobytes()
+
+
+def _iou(a, b):
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    return inter / (a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def test_moving_lesion_matches_full_pass():
+    engine = VisualDiagnosisEngine()
+    session = FrameStreamSession(engine)
+
+    for index, (frame, data) in enumerate(_moving_lesion_frames()):
+        session.process_frame(data)
+        full = engine.find_regions(engine.build_masks(engine.enhance(frame)))
+        patched = list(session._detections)
+
+        assert len(patched) == len(full), f"frame {index}: {patched} vs {full}"
+        for expected in full:
+            best = max((d for d in patched if d['label'] == expected['label']),
+                       key=lambda d: _iou(d['bbox'], expected['bbox']), default=None)
+            assert best is not None, f"frame {index}: missing {expected}"
+            assert _iou(best['bbox'], expected['bbox']) > 0.8, f"frame {index}: {best} vs {expected}"
+            patched.remove(best)
+
+
+def test_undecodable_frame_reports_error():
+    session = FrameStreamSession(VisualDiagnosisEngine())
+    result = session.process_frame(b"not an image")
+    assert "error" in result
@@ -0,0 +1,191 @@
+import sqlite3
+import time
+
+SEVERITY_RANK = {"Mild": 0, "Moderate": 1, "Severe": 2}
+
+# Relative area change (%) below which two snapshots count as "stable"
+STABLE_AREA_PCT = 10.0
+# Max mean per-byte descriptor distance (0-255) for two regions to be the same lesion
+MATCH_DISTANCE = 48.0
+# Side of the engine's analysis frame; bboxes are stored in these pixel coordinates
+FRAME_SIZE = 800
+# Max bbox-centre offset, in diagonals of the larger bbox, for two regions to be the same lesion
+MAX_CENTRE_OFFSET = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    captured_at REAL NOT NULL,
+    image_path TEXT,
+    label TEXT NOT NULL,
+    severity TEXT,
+    confidence REAL,
+    total_area INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_patient_time ON snapshots (patient_id, captured_at);
+
+CREATE TABLE IF NOT EXISTS regions (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    area INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    w INTEGER NOT NULL,
+    h INTEGER NOT NULL,
+    descriptor BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_regions_snapshot ON regions (snapshot_id);
+"""
+
+
+class ProgressStore:
+    """
+    Embedded per-patient history of analysis snapshots.
+
+    Every snapshot keeps the summary (label, severity, total area) plus the
+    detected regions with their compact descriptors, so a new image is compared
+    against history through an indexed lookup instead of re-analysing old photos.
+    """
+
+    def __init__(self, db_path: str):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def record(self, patient_id: str, result: dict, image_path: str = None, captured_at: float = None):
+        """Stores an engine result produced with include_regions=True; returns the snapshot id."""
+        regions = result.get("regions", [])
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO snapshots (patient_id, captured_at, image_path, label, severity, confidence, total_area) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (patient_id, captured_at if captured_at is not None else time.time(), image_path,
+                 result["label"], result.get("severity"), result.get("confidence"),
+                 sum(r["area"] for r in regions))
+            )
+            snapshot_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO regions (snapshot_id, label, area, x, y, w, h, descriptor) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(snapshot_id, r["label"], r["area"], *r["bbox"], bytes(r["descriptor"])) for r in regions]
+            )
+        return snapshot_id
+
+    def latest(self, patient_id: str, before: float = None):
+        """Most recent snapshot (with regions) taken at or before `before`, or None."""
+        if before is None:
+            before = float("inf")
+        row = self.conn.execute(
+            "SELECT * FROM snapshots WHERE patient_id = ? AND captured_at <= ? "
+            "ORDER BY captured_at DESC LIMIT 1",
+            (patient_id, before)
+        ).fetchone()
+        if row is None:
+            return None
+        snapshot = dict(row)
+        snapshot["regions"] = [{
+            "label": r["label"],
+            "area": r["area"],
+            "bbox": [r["x"], r["y"], r["w"], r["h"]],
+            "descriptor": list(r["descriptor"] or b"")
+        } for r in self.conn.execute("SELECT * FROM regions WHERE snapshot_id = ?", (row["id"],))]
+        return snapshot
+
+    def history(self, patient_id: str, since: float = None, until: float = None, limit: int = None):
+        """Snapshot summaries (without regions) in time order, served from the (patient_id, captured_at) index."""
+        query = "SELECT * FROM snapshots WHERE patient_id = ? AND captured_at BETWEEN ? AND ? ORDER BY captured_at"
+        params = [patient_id, since if since is not None else float("-inf"), until if until is not None else float("inf")]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self.conn.execute(query, params)]
+
+    def count(self, patient_id: str):
+        return self.conn.execute("SELECT COUNT(*) FROM snapshots WHERE patient_id = ?", (patient_id,)).fetchone()[0]
+
+
+def _descriptor_distance(a, b):
+    if not a or not b or len(a) != len(b):
+        return float("inf")
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+def _match_cost(old, new):
+    """
+    Lower is a better pairing; None means the regions cannot be the same lesion.
+    Both colour and position gate the match: a look-alike region elsewhere on
+    the frame is a different lesion, not the same one that moved. Within the
+    gates, position also separates look-alike neighbours such as two scrapes.
+    """
+    dist = _descriptor_distance(old["descriptor"], new["descriptor"])
+    if dist > MATCH_DISTANCE:
+        return None
+    ox, oy, ow, oh = old["bbox"]
+    nx, ny, nw, nh = new["bbox"]
+    offset = ((ox + ow / 2 - nx - nw / 2) ** 2 + (oy + oh / 2 - ny - nh / 2) ** 2) ** 0.5
+    reach = MAX_CENTRE_OFFSET * max((ow ** 2 + oh ** 2) ** 0.5, (nw ** 2 + nh ** 2) ** 0.5)
+    if offset > reach:
+        return None
+    return dist / MATCH_DISTANCE + offset / (FRAME_SIZE * 2 ** 0.5)
+
+
+def diff_snapshots(previous: dict, current: dict):
+    """
+    Incremental comparison of two snapshots. Regions are paired by label, colour
+    descriptor and bbox position, so a lesion photographed from a slightly
+    different angle still matches its earlier self without swapping places with
+    a similar-looking neighbour.
+    """
+    prev_area = previous["total_area"]
+    cur_area = current["total_area"]
+    area_change_pct = round((cur_area - prev_area) / prev_area * 100, 1) if prev_area else None
+
+    prev_rank = SEVERITY_RANK.get(previous["severity"], 0)
+    cur_rank = SEVERITY_RANK.get(current["severity"], 0)
+    if cur_rank > prev_rank or (area_change_pct is not None and area_change_pct > STABLE_AREA_PCT):
+        trend = "worsening"
+    elif cur_rank < prev_rank or (area_change_pct is not None and area_change_pct < -STABLE_AREA_PCT):
+        trend = "improving"
+    elif not prev_area and cur_area:
+        trend = "worsening"
+    else:
+        trend = "stable"
+
+    unmatched = list(previous["regions"])
+    matched, new = [], []
+    for region in sorted(current["regions"], key=lambda r: r["area"], reverse=True):
+        best, best_cost = None, None
+        for old in unmatched:
+            if old["label"] != region["label"]:
+                continue
+            cost = _match_cost(old, region)
+            if cost is not None and (best_cost is None or cost < best_cost):
+                best, best_cost = old, cost
+        if best is None:
+            new.append(region["label"])
+            continue
+        unmatched.remove(best)
+        matched.append({
+            "label": region["label"],
+            "area_before": best["area"],
+            "area_now": region["area"],
+            "area_change_pct": round((region["area"] - best["area"]) / best["area"] * 100, 1) if best["area"] else None
+        })
+
+    return {
+        "previous_snapshot": previous["id"],
+        "previous_captured_at": previous["captured_at"],
+        "label_changed": previous["label"] != current["label"],
+        "severity_before": previous["severity"],
+        "severity_now": current["severity"],
+        "area_change_pct": area_change_pct,
+        "trend": trend,
+        "matched_regions": matched,
+        "new_regions": new,
+        "resolved_regions": [r["label"] for r in unmatched]
+    }